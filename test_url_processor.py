@@ -0,0 +1,454 @@
+import asyncio
+import time
+from collections import deque
+
+from aiohttp import web
+
+import url_processor
+
+
+async def start_server(handler):
+    # a small local stand-in for a flaky web server
+    app = web.Application()
+    app.router.add_get("/{path:.*}", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    return runner, f"http://{host}:{port}"
+
+
+def make_valves(**overrides):
+    valves = url_processor.Tools.Valves(backoff_base=0.01, backoff_max=1)
+    for key, value in overrides.items():
+        setattr(valves, key, value)
+    return valves
+
+
+def run_fetch(handler, path="/", valves=None, breaker=None, ttfb_samples=None):
+    async def run():
+        runner, base_url = await start_server(handler)
+        try:
+            return await url_processor.fetch(
+                base_url + path,
+                valves or make_valves(),
+                breaker or url_processor.CircuitBreaker(),
+                deque() if ttfb_samples is None else ttfb_samples,
+            )
+        finally:
+            await runner.cleanup()
+
+    return asyncio.run(run())
+
+
+def test_retry_after_is_honored():
+    calls = []
+
+    async def handler(request):
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            return web.Response(status=503, headers={"Retry-After": "0.3"})
+        return web.Response(body=b"ok")
+
+    assert run_fetch(handler) == b"ok"
+    assert len(calls) == 2
+    assert calls[1] - calls[0] >= 0.3
+
+
+def test_server_errors_are_retried():
+    calls = []
+
+    async def handler(request):
+        calls.append(request.path)
+        if len(calls) < 3:
+            return web.Response(status=500)
+        return web.Response(body=b"ok")
+
+    assert run_fetch(handler) == b"ok"
+    assert len(calls) == 3
+
+
+def test_client_errors_are_not_retried():
+    calls = []
+
+    async def handler(request):
+        calls.append(request.path)
+        return web.Response(status=404)
+
+    try:
+        run_fetch(handler)
+    except url_processor.RequestError as e:
+        assert e.status == 404
+    else:
+        raise AssertionError("expected a RequestError")
+    assert len(calls) == 1
+
+
+def test_no_retries():
+    calls = []
+
+    async def handler(request):
+        calls.append(request.path)
+        return web.Response(status=503)
+
+    try:
+        run_fetch(handler, valves=make_valves(max_retries=0))
+    except url_processor.RequestError as e:
+        assert e.status == 503
+    else:
+        raise AssertionError("expected a RequestError")
+    assert len(calls) == 1
+
+
+def test_hedged_request_beats_slow_response():
+    calls = []
+
+    async def handler(request):
+        calls.append(request.path)
+        if len(calls) == 1:
+            await asyncio.sleep(2)
+        return web.Response(body=b"ok")
+
+    async def run():
+        runner, base_url = await start_server(handler)
+        valves = make_valves(hedge_requests=True, hedge_min_samples=3)
+        try:
+            started = time.monotonic()
+            content = await url_processor.fetch(
+                base_url,
+                valves,
+                url_processor.CircuitBreaker(),
+                deque([0.01] * 5),
+            )
+            return content, time.monotonic() - started
+        finally:
+            await runner.cleanup()
+
+    content, elapsed = asyncio.run(run())
+    assert content == b"ok"
+    assert len(calls) == 2
+    assert elapsed < 1
+
+
+def test_circuit_breaker_fails_fast():
+    calls = []
+
+    async def handler(request):
+        calls.append(request.path)
+        return web.Response(status=503)
+
+    async def run():
+        runner, base_url = await start_server(handler)
+        valves = make_valves(max_retries=0, circuit_breaker_threshold=2)
+        breaker = url_processor.CircuitBreaker()
+        errors = []
+        try:
+            for _ in range(3):
+                try:
+                    await url_processor.fetch(base_url, valves, breaker, deque())
+                except url_processor.RequestError as e:
+                    errors.append(e)
+        finally:
+            await runner.cleanup()
+        return errors
+
+    errors = asyncio.run(run())
+    assert len(calls) == 2
+    assert errors[2].status is None
+    assert "circuit open" in str(errors[2])
+
+
+def test_negative_valves_are_rejected():
+    from pydantic import ValidationError
+
+    for field in ("max_retries", "backoff_base", "circuit_breaker_threshold"):
+        try:
+            url_processor.Tools.Valves(**{field: -1})
+        except ValidationError:
+            continue
+        raise AssertionError(f"{field} accepted a negative value")
+
+
+def run_crawl(handler, path="/", **kwargs):
+    async def run():
+        runner, base_url = await start_server(handler)
+        tools = url_processor.Tools()
+        tools.valves.crawl_delay = 0
+        tools.valves.backoff_base = 0.01
+        try:
+            return await tools.crawl_site(base_url + path, "", "", {}, **kwargs)
+        finally:
+            await runner.cleanup()
+
+    return asyncio.run(run())
+
+
+def html_page(title, body=""):
+    return web.Response(
+        text=f"<title>{title}</title><h1>{title}</h1>{body}", content_type="text/html"
+    )
+
+
+def test_crawl_follows_links_relative_to_redirects():
+    async def handler(request):
+        if request.path == "/robots.txt":
+            return web.Response(status=404)
+        if request.path == "/docs":
+            raise web.HTTPMovedPermanently("/docs/")
+        if request.path == "/docs/":
+            return html_page("docs", '<a href="intro">intro</a>')
+        if request.path == "/docs/intro":
+            return html_page("intro")
+        if request.path == "/based":
+            return html_page("based", '<base href="/docs/"><a href="intro">intro</a>')
+        return web.Response(status=404)
+
+    result = run_crawl(handler, "/docs")
+    urls = [page["url"] for page in result["pages"]]
+    assert urls[0].endswith("/docs/")
+    assert urls[1].endswith("/docs/intro")
+    assert "errors" not in result
+
+    result = run_crawl(handler, "/based")
+    assert result["pages"][1]["url"].endswith("/docs/intro")
+
+
+def test_crawl_survives_malformed_links():
+    async def handler(request):
+        if request.path == "/robots.txt":
+            return web.Response(status=404)
+        if request.path == "/":
+            return html_page(
+                "home",
+                '<a href="http://host:abc/">bad port</a>'
+                '<a href="http://[::1/">bad ipv6</a>'
+                '<a href="/a">a</a>',
+            )
+        return html_page(request.path)
+
+    result = run_crawl(handler)
+    urls = [page["url"] for page in result["pages"]]
+    assert len(urls) == 2
+    assert urls[1].endswith("/a")
+    assert "errors" not in result
+
+    result = run_crawl(handler, ":abc/")
+    assert "invalid url" in result["error"]
+
+
+def test_crawl_skips_pages_that_are_not_html():
+    async def handler(request):
+        if request.path == "/robots.txt":
+            return web.Response(text="User-agent: *\nDisallow: /private\n")
+        if request.path == "/":
+            return html_page(
+                "home", '<a href="/download">file</a><a href="/moved">moved</a>'
+            )
+        if request.path == "/download":
+            return web.Response(body=b"%PDF-1.4", content_type="application/pdf")
+        if request.path == "/moved":
+            raise web.HTTPFound("/private/page")
+        return html_page(request.path)
+
+    result = run_crawl(handler)
+    assert len(result["pages"]) == 1
+    assert result["skipped_by_robots_txt"][0].endswith("/private/page")
+
+
+def test_crawl_unreachable_robots_disallows_everything():
+    async def handler(request):
+        if request.path == "/robots.txt":
+            return web.Response(status=503)
+        return html_page("home")
+
+    result = run_crawl(handler)
+    assert result["pages"] == []
+    assert len(result["skipped_by_robots_txt"]) == 1
+
+
+def test_crawl_invalid_include_pattern():
+    async def handler(request):
+        return html_page("home")
+
+    result = run_crawl(handler, include_pattern="docs/(")
+    assert "invalid include_pattern" in result["error"]
+
+
+def test_canonicalize_url():
+    assert (
+        url_processor.canonicalize_url("HTTP://Example.com:80/a/index.html?b=2&a=1#x")
+        == "http://example.com/a/?a=1&b=2"
+    )
+    assert (
+        url_processor.canonicalize_url("http://[::1]:8080/a") == "http://[::1]:8080/a"
+    )
+
+
+def test_warm_up_starts_when_valves_are_assigned():
+    tools = url_processor.Tools()
+    assert tools.warm_up.thread is None
+
+    tools.valves = tools.Valves(
+        warm_up=True, warm_up_modules="colorsys, json, not_a_module"
+    )
+    tools.warm_up.thread.join(5)
+
+    assert isinstance(tools.warm_up.timings["colorsys"], float)
+    assert tools.warm_up.timings["json"] == "imported elsewhere"
+    assert tools.warm_up.timings["not_a_module"].startswith("failed")
+
+
+def run_process_url(handler, path, purpose="", **valves):
+    async def run():
+        runner, base_url = await start_server(handler)
+        tools = url_processor.Tools()
+        for key, value in valves.items():
+            setattr(tools.valves, key, value)
+        try:
+            return await tools.process_url(base_url + path, purpose, "", {})
+        finally:
+            await runner.cleanup()
+
+    return asyncio.run(run())
+
+
+def test_small_text_files_are_returned_whole():
+    source = "".join(f"print({i})\n" for i in range(400))
+
+    async def handler(request):
+        return web.Response(body=source.encode("utf-16"))
+
+    result = run_process_url(handler, "/module.py")
+    assert result["data"] == source
+
+
+def test_big_text_files_are_windowed():
+    log = "".join(
+        f"line {i} {'ERROR disk full' if i == 5000 else 'ok'}\n" for i in range(10000)
+    )
+
+    async def handler(request):
+        return web.Response(body=log.encode())
+
+    result = run_process_url(
+        handler,
+        "/server.log",
+        'find "error" lines',
+        text_max_bytes=1000,
+        text_head_lines=2,
+        text_tail_lines=1,
+    )
+    data = result["data"]
+    assert result["size"] == len(log)
+    assert data["lines"] == 10000
+    assert data["head"] == "line 0 ok\nline 1 ok"
+    assert data["tail"] == "line 9999 ok"
+    assert data["omitted_lines"] == 9997
+    assert data["matching_lines"] == [
+        {"line": 5001, "text": "line 5000 ERROR disk full"}
+    ]
+
+
+def test_hedge_cancels_the_slower_request_once_one_responds():
+    calls = []
+
+    async def handler(request):
+        calls.append(request.path)
+        if len(calls) == 1:
+            # slow to respond, but does respond while the other body is still downloading
+            await asyncio.sleep(0.3)
+            return web.Response(body=b"slow")
+
+        response = web.StreamResponse()
+        await response.prepare(request)
+        for _ in range(6):
+            await response.write(b"fast")
+            await asyncio.sleep(0.1)
+        await response.write_eof()
+        return response
+
+    async def run():
+        runner, base_url = await start_server(handler)
+        valves = make_valves(hedge_requests=True, hedge_min_samples=3)
+        ttfb_samples = deque([0.01] * 5)
+        try:
+            content = await url_processor.fetch(
+                base_url, valves, url_processor.CircuitBreaker(), ttfb_samples
+            )
+            return content, list(ttfb_samples)[5:]
+        finally:
+            await runner.cleanup()
+
+    content, new_samples = asyncio.run(run())
+    assert content == b"fast" * 6
+    assert len(calls) == 2
+    # the slow request was cancelled before it got its response
+    assert len(new_samples) == 1
+
+
+def test_import_module_does_not_block_the_event_loop():
+    import sys
+    import threading
+
+    started = threading.Event()
+    release = threading.Event()
+
+    class SlowFinder:
+        # pretends to be a module that takes a while to import
+        def find_spec(self, name, path=None, target=None):
+            if name != "slow_test_module":
+                return None
+            import importlib.util
+
+            return importlib.util.spec_from_loader(name, self)
+
+        def create_module(self, spec):
+            return None
+
+        def exec_module(self, module):
+            started.set()
+            release.wait(5)
+
+    async def run():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while not release.is_set():
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticking = asyncio.create_task(ticker())
+        importing = asyncio.create_task(url_processor.import_module("slow_test_module"))
+        await asyncio.to_thread(started.wait, 5)
+        await asyncio.sleep(0.2)
+        release.set()
+        module = await importing
+        await ticking
+        return module, ticks
+
+    finder = SlowFinder()
+    sys.meta_path.insert(0, finder)
+    try:
+        module, ticks = asyncio.run(run())
+    finally:
+        sys.meta_path.remove(finder)
+        sys.modules.pop("slow_test_module", None)
+
+    assert module.__name__ == "slow_test_module"
+    assert ticks > 5
+
+
+def test_text_window_finds_matches_past_the_clip_point():
+    window = url_processor.TextWindow(1, 1, 10, 10, ["needle"])
+    line = "x" * 100 + "NEEDLE" + "x" * 100
+    # feed it in small pieces, so the term is also split across pieces
+    text = f"first\n{line}\nlast\n"
+    for i in range(0, len(text), 7):
+        window.feed(text[i : i + 7])
+    window.finish()
+
+    assert window.lines == 3
+    assert window.match_count == 1
+    assert window.matches == [{"line": 2, "text": "x" * 10 + "…"}]
@@ -58,17 +58,843 @@ async def emit_message(event_emitter, content: str):
         )
 
 
+# statuses that are worth retrying. anything else (404, 403..) won't get better by asking again
+RETRYABLE_STATUSES = (408, 425, 429, 500, 502, 503, 504)
+
+
+class RequestError(Exception):
+    def __init__(self, message: str, status: int = None, retry_after: float = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.status is None or self.status in RETRYABLE_STATUSES
+
+
+class CircuitBreaker:
+    # keeps track of hosts that keep failing, so we can fail fast instead of
+    # waiting on timeouts and retries for a host that's clearly down.
+    # after the cooldown, a single trial request is let through.
+    # if that works, the host is trusted again. if not, it stays blocked for another cooldown.
+
+    def __init__(self):
+        self.hosts = {}
+
+    def allow(self, host: str, threshold: int, cooldown: float) -> bool:
+        import time
+
+        state = self.hosts.get(host)
+        if not state or threshold <= 0 or state["failures"] < threshold:
+            return True
+
+        now = time.monotonic()
+        if now - state["opened_at"] < cooldown:
+            return False
+
+        # let this one through as a trial, and keep everything else out for another cooldown
+        state["opened_at"] = now
+        return True
+
+    def record_success(self, host: str):
+        self.hosts.pop(host, None)
+
+    def record_failure(self, host: str, threshold: int):
+        import time
+
+        state = self.hosts.setdefault(host, {"failures": 0, "opened_at": 0.0})
+        state["failures"] += 1
+        if threshold > 0 and state["failures"] >= threshold:
+            state["opened_at"] = time.monotonic()
+
+
+def parse_retry_after(value: str):
+    # Retry-After can either be a number of seconds or a http date
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        from email.utils import parsedate_to_datetime
+        from datetime import datetime, timezone
+
+        when = parsedate_to_datetime(value)
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+        return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def percentile(samples, pct: float):
+    if not samples:
+        return None
+
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def fetch(
+    url: str, valves, breaker: CircuitBreaker, ttfb_samples, consume=None
+) -> bytes:
+    # fetches a url with retries (jittered exponential backoff that honors Retry-After),
+    # optional hedged requests for slow servers and a per-host circuit breaker.
+    # by default the whole body is returned. pass an async consume(response) function
+    # to read the body yourself instead, its return value is returned.
+    # it's called again from scratch on every retry, so it shouldn't keep state between calls.
+    import random
+    import time
+    import urllib.parse
+
+    host = urllib.parse.urlparse(url).netloc
+
+    if not breaker.allow(
+        host, valves.circuit_breaker_threshold, valves.circuit_breaker_cooldown
+    ):
+        raise RequestError(
+            f"Request failed: {host} keeps failing, skipping it for now (circuit open)"
+        )
+
+    async def attempt(session, race=None):
+        started = time.monotonic()
+        if consume:
+            # streamed bodies can be huge, so only time out when the server stops sending data
+            timeout = aiohttp.ClientTimeout(
+                sock_connect=valves.request_timeout, sock_read=valves.request_timeout
+            )
+        else:
+            timeout = aiohttp.ClientTimeout(total=valves.request_timeout)
+
+        async with session.get(url, timeout=timeout) as response:
+            ttfb_samples.append(time.monotonic() - started)
+
+            if race is not None:
+                # the first request to get a response wins. cancel the other one right away,
+                # so the body is only downloaded once
+                race["responded"].set()
+                for task in race["tasks"]:
+                    if task is not asyncio.current_task():
+                        task.cancel()
+
+            if response.status != 200:
+                raise RequestError(
+                    f"Request failed with status {response.status}",
+                    status=response.status,
+                    retry_after=parse_retry_after(response.headers.get("Retry-After")),
+                )
+            if consume:
+                return await consume(response)
+            return await response.read()
+
+    async def hedged_attempt(session):
+        # send the request, and if the first byte takes longer than usual,
+        # send a second one. whichever responds first wins.
+        hedge_delay = None
+        if valves.hedge_requests and len(ttfb_samples) >= valves.hedge_min_samples:
+            hedge_delay = percentile(ttfb_samples, valves.hedge_percentile)
+
+        if hedge_delay is None:
+            return await attempt(session)
+
+        race = {"responded": asyncio.Event(), "tasks": []}
+        tasks = race["tasks"]
+        tasks.append(asyncio.create_task(attempt(session, race)))
+
+        try:
+            responded = asyncio.create_task(race["responded"].wait())
+            await asyncio.wait(
+                {tasks[0], responded},
+                timeout=hedge_delay,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            responded.cancel()
+
+            if not race["responded"].is_set() and not tasks[0].done():
+                tasks.append(asyncio.create_task(attempt(session, race)))
+
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.cancelled():
+                        # lost the race
+                        continue
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    last_error = None
+    async with aiohttp.ClientSession(
+        headers={"User-Agent": valves.user_agent}
+    ) as session:
+        for attempt_number in range(max(0, valves.max_retries) + 1):
+            if attempt_number > 0:
+                # full jitter, but never sooner than the server asked us to wait
+                delay = random.uniform(
+                    0,
+                    min(
+                        valves.backoff_max,
+                        valves.backoff_base * 2 ** (attempt_number - 1),
+                    ),
+                )
+                if last_error.retry_after is not None:
+                    if last_error.retry_after > valves.backoff_max:
+                        # not going to wait that long. just give up
+                        break
+                    delay = max(delay, last_error.retry_after)
+                await asyncio.sleep(delay)
+
+            try:
+                content = await hedged_attempt(session)
+                breaker.record_success(host)
+                return content
+            except RequestError as e:
+                last_error = e
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                last_error = RequestError(
+                    f"Request failed: {type(e).__name__} {e}".strip()
+                )
+
+            if not last_error.retryable:
+                break
+
+    if last_error.retryable:
+        # only count failures that say something about the host itself
+        breaker.record_failure(host, valves.circuit_breaker_threshold)
+    else:
+        breaker.record_success(host)
+
+    raise last_error
+
+
+def remove_duplicates(lst: list):
+    # removes duplicates from a list
+
+    new_lst = []
+    for item in lst:
+        if item not in new_lst:
+            new_lst.append(item)
+    return new_lst
+
+
+async def scrape_webpage(html, event_emitter=None, soup=None):
+    # uses beautifulsoup to scrape a webpage.
+    # pass in an already parsed soup to avoid parsing the same page twice
+
+    output = {}
+
+    import re
+
+    BeautifulSoup = (await import_module("bs4")).BeautifulSoup
+
+    if soup is None:
+        soup = await asyncio.to_thread(BeautifulSoup, html, "html.parser")
+
+    await emit_status(event_emitter, "Processing website..", False)
+
+    # we can usually get plenty of information from just the title, headers and paragraphs of a page!
+    try:
+        output["title"] = soup.find("title").get_text().strip()
+    except AttributeError:
+        # no title found
+        pass
+
+    output["headers"] = []
+    for header in soup.find_all(["h1", "h2", "h3", "h4", "h5", "h6"]):
+        output["headers"].append(header.get_text().strip())
+    if not output["headers"]:
+        del output["headers"]
+
+    output["paragraphs"] = []
+    for para in soup.find_all("p"):
+        output["paragraphs"].append(para.get_text().strip())
+    if not output["paragraphs"]:
+        del output["paragraphs"]
+
+    output["images"] = []
+    for image in soup.find_all("img"):
+        if image.get("alt"):
+            output["images"].append(image.get("alt"))
+
+    if not output["images"]:
+        del output["images"]
+
+    # remove duplicates
+    for category in list(output.keys()):
+        if category == "title":
+            continue
+
+        output[category] = remove_duplicates(output[category])
+
+    # but not always...
+    if "headers" not in output.keys() and "paragraphs" not in output.keys():
+        # if nothing was found, first, fall back on common CSS classes
+        output["classes"] = {}
+        for class_name in (
+            "content",
+            "description",
+            "title",
+            "text",
+            "article",
+        ):
+            output["classes"][class_name] = []
+            for element in soup.find_all(class_=re.compile(rf"\b{class_name}\b")):
+                if element.text != "":
+                    output["classes"][class_name].append(element.text)
+            # also get elements by id
+            for element in soup.find_all(id=re.compile(rf"\b{class_name}\b")):
+                if element.text != "":
+                    output["classes"][class_name].append(element.text)
+
+            if not output["classes"][class_name]:
+                # no data found for the class? just delete it from the response
+                del output["classes"][class_name]
+                continue
+
+            # remove duplicates
+            output["classes"][class_name] = remove_duplicates(
+                output["classes"][class_name]
+            )
+
+        if not output["classes"]:
+            # still nothing?
+            # then fall back on links if nothing could be extracted from the other html elements.
+            # this is a last resort because it tends to be a lot of data to process
+
+            del output["classes"]
+
+            output["urls"] = []
+            for a in soup.find_all("a", href=True):
+                output["urls"].append(a["href"])
+
+            # remove duplicate links
+            output["urls"] = remove_duplicates(output["urls"])
+
+            if not output["urls"]:
+                # alright, theres no saving this one. at least we have a title!
+                del output["urls"]
+
+                output["message"] = (
+                    "nothing could be scraped from the page! use a web search tool call to find more information about this website."
+                )
+
+    await emit_status(event_emitter, "Processed website", True)
+
+    return output
+
+
+def canonicalize_url(url: str) -> str:
+    # normalizes a url so the same page isn't crawled twice under slightly different urls
+    import urllib.parse
+
+    parsed = urllib.parse.urlparse(url)
+    scheme = parsed.scheme.lower()
+    host = (parsed.hostname or "").lower()
+    if ":" in host:
+        # ipv6 addresses need their brackets back
+        host = f"[{host}]"
+    if parsed.port and (scheme, parsed.port) not in (("http", 80), ("https", 443)):
+        host = f"{host}:{parsed.port}"
+
+    path = parsed.path or "/"
+    for index_page in ("index.html", "index.htm", "index.php"):
+        if path.endswith("/" + index_page):
+            path = path[: -len(index_page)]
+
+    # drop tracking parameters and sort the rest so the order doesn't matter
+    query = sorted(
+        (key, value)
+        for key, value in urllib.parse.parse_qsl(parsed.query, keep_blank_values=True)
+        if not key.lower().startswith("utm_")
+    )
+
+    return urllib.parse.urlunparse(
+        (scheme, host, path, "", urllib.parse.urlencode(query), "")
+    )
+
+
+async def import_module(name: str):
+    # imports a module without blocking the event loop.
+    # a slow import (or waiting on the warm-up thread, if it's importing the same module
+    # right now) happens in a thread instead, so other requests keep going in the meantime
+    import sys
+    import importlib
+
+    module = sys.modules.get(name)
+    if module is not None and not getattr(
+        getattr(module, "__spec__", None), "_initializing", False
+    ):
+        # already fully imported, no need for a thread
+        return module
+
+    return await asyncio.to_thread(importlib.import_module, name)
+
+
+class WarmUp:
+    # imports the heavy modules the processors need in a background thread,
+    # so the first pdf or video request doesn't have to pay for importing them.
+    # processors get their modules through import_module, so they never block the event loop
+    # on a warm-up that's still running. note that the warm-up thread does still compete
+    # with the event loop for the GIL while it's importing, so requests made in the first
+    # second or so after the valves are set can be a little slower.
+
+    def __init__(self):
+        self.thread = None
+        self.timings = {}
+
+    def start(self, modules: str):
+        import threading
+
+        if self.thread is not None:
+            return
+
+        names = [name.strip() for name in modules.split(",") if name.strip()]
+        self.thread = threading.Thread(
+            target=self.run, args=(names,), name="url-processor-warm-up", daemon=True
+        )
+        self.thread.start()
+
+    def run(self, names: list):
+        import sys
+        import importlib
+        import time
+
+        for name in names:
+            if name in sys.modules:
+                # a processor got there first, so there's nothing to measure
+                self.timings[name] = "imported elsewhere"
+                continue
+
+            started = time.perf_counter()
+            try:
+                importlib.import_module(name)
+            except Exception as e:
+                # not installed, or broken. the processor will report it when it's actually used
+                self.timings[name] = f"failed: {type(e).__name__}: {e}"
+                continue
+            self.timings[name] = round(time.perf_counter() - started, 4)
+
+
+def detect_encoding(sample: bytes, declared: str = None) -> tuple:
+    # figures out the encoding of some text from the first few kilobytes of it.
+    # returns the encoding and how many bytes of BOM to skip
+    import codecs
+
+    for bom, encoding in (
+        (codecs.BOM_UTF32_LE, "utf-32-le"),
+        (codecs.BOM_UTF32_BE, "utf-32-be"),
+        (codecs.BOM_UTF8, "utf-8"),
+        (codecs.BOM_UTF16_LE, "utf-16-le"),
+        (codecs.BOM_UTF16_BE, "utf-16-be"),
+    ):
+        if sample.startswith(bom):
+            return encoding, len(bom)
+
+    # utf-16 without a BOM: mostly-ascii text will have a zero byte in every other position
+    if len(sample) >= 2:
+        even_zeros = sample[0::2].count(0) / len(sample[0::2])
+        odd_zeros = sample[1::2].count(0) / len(sample[1::2])
+        if odd_zeros > 0.3 and even_zeros < 0.05:
+            return "utf-16-le", 0
+        if even_zeros > 0.3 and odd_zeros < 0.05:
+            return "utf-16-be", 0
+
+    # if it decodes as utf-8, it almost certainly is utf-8.
+    # (the sample might end halfway through a character, so decode it incrementally)
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8", 0
+    except UnicodeDecodeError:
+        pass
+
+    if declared:
+        try:
+            return codecs.lookup(declared).name, 0
+        except LookupError:
+            pass
+
+    # most likely some flavour of latin-1
+    return "cp1252", 0
+
+
+class TextWindow:
+    # keeps a bounded window of a text that's fed to it in pieces:
+    # the first and last lines, and lines containing any of the search terms.
+    # never holds more than that in memory, no matter how big the text is.
+
+    def __init__(
+        self,
+        head_lines: int,
+        tail_lines: int,
+        max_line_length: int,
+        max_matches: int,
+        search_terms: list = None,
+    ):
+        import re
+        from collections import deque
+
+        self.head_lines = head_lines
+        self.max_line_length = max_line_length
+        self.max_matches = max_matches
+
+        self.head = []
+        self.tail = deque(maxlen=tail_lines)
+        self.matches = []
+        self.match_count = 0
+        self.search = None
+        self.search_terms = [term.lower() for term in search_terms or []]
+        if search_terms:
+            self.search = re.compile(
+                "|".join(re.escape(term) for term in search_terms), re.IGNORECASE
+            )
+
+        self.lines = 0
+        self.pending = ""
+        self.pending_overflow = False
+        self.truncated = False
+
+        # for lines that are too long to keep: whether it's already been matched,
+        # and the end of what was searched so far, so terms split across pieces are still found
+        self.long_line_matched = False
+        self.long_line_overlap = ""
+        self.overlap_length = (
+            max((len(term) for term in self.search_terms), default=1) - 1
+        )
+
+    def clip(self, line: str) -> str:
+        line = line.rstrip("\r")
+        if len(line) > self.max_line_length:
+            self.truncated = True
+            return line[: self.max_line_length] + "…"
+        return line
+
+    def feed(self, text: str):
+        if self.pending_overflow:
+            # the current line is already way too long. search the rest of it, but don't keep it
+            newline = text.find("\n")
+            self.search_long_line(text if newline == -1 else text[:newline])
+            if newline == -1:
+                return
+            self.finish_long_line()
+            text = text[newline + 1 :]
+
+        text = self.pending + text
+        last_newline = text.rfind("\n")
+        if last_newline == -1:
+            self.pending = text
+        else:
+            self.add_lines(text[:last_newline])
+            self.pending = text[last_newline + 1 :]
+
+        if len(self.pending) > self.max_line_length:
+            self.pending_overflow = True
+            self.long_line_matched = False
+            self.long_line_overlap = ""
+            self.search_long_line(self.pending)
+            self.pending = self.pending[: self.max_line_length + 1]
+
+    def search_long_line(self, text: str):
+        if not self.search or self.long_line_matched:
+            return
+
+        text = self.long_line_overlap + text
+        lowered = text.lower()
+        if any(term in lowered for term in self.search_terms) and self.search.search(
+            text
+        ):
+            self.long_line_matched = True
+            self.match_count += 1
+            if len(self.matches) < self.max_matches:
+                self.matches.append(
+                    {"line": self.lines + 1, "text": self.clip(self.pending)}
+                )
+        elif self.overlap_length:
+            self.long_line_overlap = text[-self.overlap_length :]
+
+    def finish_long_line(self):
+        # the long line was already searched, so it only goes into the head and tail
+        line = self.clip(self.pending)
+        if len(self.head) < self.head_lines:
+            self.head.append(line)
+        if self.tail.maxlen:
+            self.tail.append(line)
+        self.lines += 1
+
+        self.pending = ""
+        self.pending_overflow = False
+
+    def finish(self):
+        if self.pending_overflow:
+            self.finish_long_line()
+        elif self.pending:
+            self.add_lines(self.pending)
+        self.pending = ""
+
+    def add_lines(self, text: str):
+        # works on the whole block of lines at once instead of line by line,
+        # that's a lot faster on huge files
+        count = text.count("\n") + 1
+
+        if len(self.head) < self.head_lines:
+            wanted = self.head_lines - len(self.head)
+            self.head.extend(
+                self.clip(line) for line in text.split("\n", wanted)[:wanted]
+            )
+
+        if self.tail.maxlen:
+            self.tail.extend(
+                self.clip(line)
+                for line in text.rsplit("\n", self.tail.maxlen)[-self.tail.maxlen :]
+            )
+
+        # case insensitive regexes are slow, so first check if the block has any of the terms at all
+        lowered = text.lower() if self.search else ""
+        if self.search and any(term in lowered for term in self.search_terms):
+            line_number = self.lines + 1
+            position = 0
+            last_line_start = -1
+            for match in self.search.finditer(text):
+                line_start = text.rfind("\n", 0, match.start()) + 1
+                if line_start == last_line_start:
+                    # already got this line
+                    continue
+                line_number += text.count("\n", position, line_start)
+                position = line_start
+                last_line_start = line_start
+
+                self.match_count += 1
+                if len(self.matches) < self.max_matches:
+                    line_end = text.find("\n", match.end())
+                    self.matches.append(
+                        {
+                            "line": line_number,
+                            "text": self.clip(
+                                text[line_start : line_end if line_end != -1 else None]
+                            ),
+                        }
+                    )
+
+        self.lines += count
+
+    def result(self):
+        # the tail also saw the lines that are in the head, don't show those twice
+        rest = min(len(self.tail), self.lines - len(self.head))
+        tail = list(self.tail)[-rest:] if rest > 0 else []
+
+        # if everything fit in the window, just return the whole text
+        if not self.truncated and self.lines == len(self.head) + len(tail):
+            return "\n".join(self.head + tail)
+
+        output = {
+            "lines": self.lines,
+            "head": "\n".join(self.head),
+            "tail": "\n".join(tail),
+            "omitted_lines": self.lines - len(self.head) - len(tail),
+        }
+        if self.search:
+            output["matching_lines"] = self.matches
+            output["matching_line_count"] = self.match_count
+        return output
+
+
+async def read_text_stream(response, valves, search_terms: list = None) -> dict:
+    # decodes a text file while it's being downloaded.
+    # files up to text_max_bytes are returned whole. bigger ones are turned into
+    # a window of the file, so they never have to be held in memory as a whole.
+    import codecs
+    import hashlib
+
+    checksum = hashlib.sha256()
+    size = 0
+
+    buffered = []
+    window = None
+    decoder = None
+    encoding = None
+
+    async for chunk in response.content.iter_chunked(65536):
+        checksum.update(chunk)
+        size += len(chunk)
+
+        if window is None:
+            buffered.append(chunk)
+            if size <= valves.text_max_bytes:
+                continue
+
+            # too big to return whole, switch to a window
+            content = b"".join(buffered)
+            buffered = None
+            encoding, bom_length = detect_encoding(content[:8192], response.charset)
+            decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+            window = TextWindow(
+                valves.text_head_lines,
+                valves.text_tail_lines,
+                valves.text_max_line_length,
+                valves.text_max_matches,
+                search_terms,
+            )
+            chunk = content[bom_length:]
+
+        window.feed(decoder.decode(chunk))
+
+    if window is None:
+        content = b"".join(buffered)
+        encoding, bom_length = detect_encoding(content[:8192], response.charset)
+        data = content[bom_length:].decode(encoding, errors="replace")
+    else:
+        window.feed(decoder.decode(b"", final=True))
+        window.finish()
+
+        data = window.result()
+        if isinstance(data, dict):
+            data["encoding"] = encoding
+
+    return {
+        "size": size,
+        "checksum": checksum.hexdigest(),
+        "data": data,
+    }
+
+
 class Tools:
     class Valves(BaseModel):
         user_agent: str = Field(
             default="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.3",
             description="the user agent to use for all web requests. the default should suffice!",
         )
+        request_timeout: float = Field(
+            default=10,
+            gt=0,
+            description="how many seconds a single request is allowed to take before it's considered failed.",
+        )
+        max_retries: int = Field(
+            default=3,
+            ge=0,
+            description="how many times to retry a request that failed because of a temporary problem (timeouts, 429, 503..). set to 0 to disable retrying.",
+        )
+        backoff_base: float = Field(
+            default=0.5,
+            ge=0,
+            description="base delay in seconds between retries. doubles on every retry, with random jitter.",
+        )
+        backoff_max: float = Field(
+            default=10,
+            ge=0,
+            description="longest delay in seconds between retries. if a server asks us to wait longer than this (Retry-After), we give up instead.",
+        )
+        hedge_requests: bool = Field(
+            default=False,
+            description="if a server is slower than usual to respond, send a second identical request and use whichever answers first.",
+        )
+        hedge_percentile: float = Field(
+            default=95,
+            ge=0,
+            le=100,
+            description="percentile of recent time-to-first-byte measurements after which a hedged request is sent.",
+        )
+        hedge_min_samples: int = Field(
+            default=20,
+            ge=0,
+            description="how many responses have to be measured before hedged requests are sent.",
+        )
+        circuit_breaker_threshold: int = Field(
+            default=5,
+            ge=0,
+            description="after this many failed requests in a row to the same host, stop contacting it for a while. set to 0 to disable.",
+        )
+        circuit_breaker_cooldown: float = Field(
+            default=60,
+            ge=0,
+            description="how many seconds to stop contacting a failing host for.",
+        )
+        crawl_max_pages: int = Field(
+            default=50,
+            ge=1,
+            description="the most pages crawl_site will ever fetch in one go, no matter what the AI asks for.",
+        )
+        crawl_concurrency: int = Field(
+            default=4,
+            ge=1,
+            description="how many pages crawl_site fetches at the same time.",
+        )
+        crawl_delay: float = Field(
+            default=0.5,
+            ge=0,
+            description="minimum seconds between two requests to the same host while crawling. a longer Crawl-delay in robots.txt takes priority.",
+        )
+        crawl_respect_robots: bool = Field(
+            default=True,
+            description="whether crawl_site follows the rules in a site's robots.txt.",
+        )
+        warm_up: bool = Field(
+            default=False,
+            description="import the modules in warm_up_modules in the background when the tool is loaded, so the first pdf, video, etc. is processed faster. uses more memory, and requests made while it is still importing can be a little slower.",
+        )
+        warm_up_modules: str = Field(
+            default="bs4, pypdf, xmltodict, tinytag, rarfile, youtube_transcript_api, moviepy",
+            description="comma separated list of modules to import when warm_up is enabled.",
+        )
+        text_max_bytes: int = Field(
+            default=262144,
+            ge=0,
+            description="text files (logs, source code..) up to this many bytes are shown to the AI in full. bigger ones are cut down to their first and last lines and lines matching what the AI is looking for.",
+        )
+        text_head_lines: int = Field(
+            default=200,
+            ge=0,
+            description="for big text files (logs, source code..), how many lines from the start of the file to show the AI.",
+        )
+        text_tail_lines: int = Field(
+            default=100,
+            ge=0,
+            description="for big text files, how many lines from the end of the file to show the AI.",
+        )
+        text_max_line_length: int = Field(
+            default=2000,
+            ge=0,
+            description="for big text files, lines longer than this many characters are cut off.",
+        )
+        text_max_matches: int = Field(
+            default=100,
+            ge=0,
+            description="for big text files, the most lines matching the search terms to show the AI.",
+        )
 
     def __init__(self):
+        from collections import deque
+
+        self.warm_up = WarmUp()
         self.valves = self.Valves()
 
-        pass
+        # state for the fetch layer, shared between all requests made by this tool
+        self.circuit_breaker = CircuitBreaker()
+        self.ttfb_samples = deque(maxlen=200)
+
+    # open webui assigns the user's valves after creating the tool,
+    # so that's when the warm-up has to start, not on the first request
+    @property
+    def valves(self):
+        return self._valves
+
+    @valves.setter
+    def valves(self, valves):
+        self._valves = valves
+        if valves.warm_up:
+            self.warm_up.start(valves.warm_up_modules)
 
     async def process_url(
         self,
@@ -83,6 +909,7 @@ class Tools:
         processes any url user may have provided.
         use the "purpose" argument to describe the purpose of this request.
         use the "memory" argument for details that must be remembered by the LLM after parsing all the data, such as details about the user.
+        to find specific lines in a big text file such as a log, put the text to look for in double quotes in the "purpose" argument.
 
         will process:
         - websites
@@ -111,127 +938,13 @@ class Tools:
 
         # we define functions inside this method so that the AI can't call them
 
-        async def _request(url):
-            async with aiohttp.ClientSession(
-                headers={"User-Agent": self.valves.user_agent}
-            ) as session:
-                async with session.get(url, timeout=10) as response:
-                    if response.status != 200:
-                        raise Exception(f"Request failed with status {response.status}")
-                    return await response.read()
-
-        def remove_duplicates(lst: list):
-            # removes duplicates from a list
-
-            new_lst = []
-            for item in lst:
-                if item not in new_lst:
-                    new_lst.append(item)
-            return new_lst
+        async def _request(url, consume=None):
+            return await fetch(
+                url, self.valves, self.circuit_breaker, self.ttfb_samples, consume
+            )
 
         async def process_webpage(html):
-            # uses beautifulsoup to scrape a webpage
-
-            output = {}
-
-            import re
-            from bs4 import BeautifulSoup
-
-            soup = await asyncio.to_thread(BeautifulSoup, html, "html.parser")
-
-            await emit_status(__event_emitter__, "Processing website..", False)
-
-            # we can usually get plenty of information from just the title, headers and paragraphs of a page!
-            try:
-                output["title"] = soup.find("title").get_text().strip()
-            except AttributeError:
-                # no title found
-                pass
-
-            output["headers"] = []
-            for header in soup.find_all(["h1", "h2", "h3", "h4", "h5", "h6"]):
-                output["headers"].append(header.get_text().strip())
-            if not output["headers"]:
-                del output["headers"]
-
-            output["paragraphs"] = []
-            for para in soup.find_all("p"):
-                output["paragraphs"].append(para.get_text().strip())
-            if not output["paragraphs"]:
-                del output["paragraphs"]
-
-            output["images"] = []
-            for image in soup.find_all("img"):
-                if image.get("alt"):
-                    output["images"].append(image.get("alt"))
-
-            if not output["images"]:
-                del output["images"]
-
-            # remove duplicates
-            for category in list(output.keys()):
-                if category == "title":
-                    continue
-
-                output[category] = remove_duplicates(output[category])
-
-            # but not always...
-            if "headers" not in output.keys() and "paragraphs" not in output.keys():
-                # if nothing was found, first, fall back on common CSS classes
-                output["classes"] = {}
-                for class_name in (
-                    "content",
-                    "description",
-                    "title",
-                    "text",
-                    "article",
-                ):
-                    output["classes"][class_name] = []
-                    for element in soup.find_all(
-                        class_=re.compile(rf"\b{class_name}\b")
-                    ):
-                        if element.text != "":
-                            output["classes"][class_name].append(element.text)
-                    # also get elements by id
-                    for element in soup.find_all(id=re.compile(rf"\b{class_name}\b")):
-                        if element.text != "":
-                            output["classes"][class_name].append(element.text)
-
-                    if not output["classes"][class_name]:
-                        # no data found for the class? just delete it from the response
-                        del output["classes"][class_name]
-                        continue
-
-                    # remove duplicates
-                    output["classes"][class_name] = remove_duplicates(
-                        output["classes"][class_name]
-                    )
-
-                if not output["classes"]:
-                    # still nothing?
-                    # then fall back on links if nothing could be extracted from the other html elements.
-                    # this is a last resort because it tends to be a lot of data to process
-
-                    del output["classes"]
-
-                    output["urls"] = []
-                    for a in soup.find_all("a", href=True):
-                        output["urls"].append(a["href"])
-
-                    # remove duplicate links
-                    output["urls"] = remove_duplicates(output["urls"])
-
-                    if not output["urls"]:
-                        # alright, theres no saving this one. at least we have a title!
-                        del output["urls"]
-
-                        output["message"] = (
-                            "nothing could be scraped from the page! use a web search tool call to find more information about this website."
-                        )
-
-            await emit_status(__event_emitter__, "Processed website", True)
-
-            return output
+            return await scrape_webpage(html, __event_emitter__)
 
         async def process_search(url):
             html = await _request(url)
@@ -239,7 +952,8 @@ class Tools:
             output = []
 
             import re
-            from bs4 import BeautifulSoup
+
+            BeautifulSoup = (await import_module("bs4")).BeautifulSoup
 
             soup = await asyncio.to_thread(BeautifulSoup, html, "html.parser")
 
@@ -279,7 +993,7 @@ class Tools:
         async def process_domains(domain, url):
             if "youtube" in domain and "watch" in url or "youtu.be" in domain:
                 # this is a youtube link. try and get the transcript!
-                import youtube_transcript_api
+                youtube_transcript_api = await import_module("youtube_transcript_api")
 
                 err = None
 
@@ -312,7 +1026,7 @@ class Tools:
                         err = f"couldn't find subtitles. tell the user the title of the video!"
 
                 # get video title using beautifulsoup
-                from bs4 import BeautifulSoup
+                BeautifulSoup = (await import_module("bs4")).BeautifulSoup
 
                 html = await _request(url)
                 soup = await asyncio.to_thread(BeautifulSoup, html, "html.parser")
@@ -341,8 +1055,16 @@ class Tools:
             elif "duckduckgo" in domain:
                 return await process_search(url)
 
-        async def process_text(file_content):
-            return file_content.decode(errors="replace")
+        async def process_text(response):
+            # text is processed while it's downloading, so this gets the response instead of the content.
+            # anything in quotes in the purpose is searched for in the file
+            import re
+
+            search_terms = [
+                quoted or backticked
+                for quoted, backticked in re.findall(r'"([^"]+)"|`([^`]+)`', purpose)
+            ]
+            return await read_text_stream(response, self.valves, search_terms)
 
         async def process_image(file_content):
             import base64
@@ -350,12 +1072,12 @@ class Tools:
             return base64.b64encode(file_content).decode("utf-8")
 
         async def process_xml(file_content):
-            import xmltodict
+            xmltodict = await import_module("xmltodict")
 
             return xmltodict.parse(file_content.decode(errors="replace"))
 
         async def process_yaml(file_content):
-            import yaml
+            yaml = await import_module("yaml")
             import json
 
             try:
@@ -378,7 +1100,8 @@ class Tools:
 
         async def process_pdf(file_content):
             from io import BytesIO
-            import pypdf
+
+            pypdf = await import_module("pypdf")
 
             pdf_reader = pypdf.PdfReader(BytesIO(file_content))
             pages_text = []
@@ -391,13 +1114,14 @@ class Tools:
 
         async def process_audio(file_content):
             from io import BytesIO
-            import tinytag
+
+            tinytag = await import_module("tinytag")
 
             tag_reader = tinytag.TinyTag.get(file_obj=BytesIO(file_content))
             return tag_reader.as_dict()
 
         async def process_video(file_content):
-            import moviepy
+            moviepy = await import_module("moviepy")
             import tempfile
 
             # moviepy is stubborn and absolutely insists on a file name, not a file object
@@ -437,7 +1161,8 @@ class Tools:
 
         async def process_rar(file_content):
             from io import BytesIO
-            import rarfile
+
+            rarfile = await import_module("rarfile")
 
             rar = rarfile.RarFile(BytesIO(file_content))
             output = []
@@ -484,10 +1209,6 @@ class Tools:
         # then if that didn't do anything, switch to Processing based on file type
         import hashlib
 
-        await emit_status(__event_emitter__, "Fetching content..", False)
-        # get the content of whatever file is at the url
-        file_content = await _request(url)
-
         await emit_status(__event_emitter__, "Checking file type..", False)
 
         filetype_map = {
@@ -612,33 +1333,52 @@ class Tools:
                 processor = fetched_processor
                 break
 
-        if processor:
+        await emit_status(__event_emitter__, "Fetching content..", False)
+
+        if processor == process_text:
+            # text files are decoded while they're downloading,
+            # so huge logs never have to be held in memory as a whole
             await emit_status(
                 __event_emitter__, f"Processing {file_type} file..", False
             )
-            output = await processor(file_content)
+            text = await _request(url, consume=process_text)
+            output = text["data"]
+            file_size = text["size"]
+            checksum = text["checksum"]
             await emit_status(__event_emitter__, f"Processed {file_type} file", True)
-        elif len(file_name_split) <= 1:
-            # for now, we assume it's a website.
-            # TODO: add mime type checking
-            await emit_status(__event_emitter__, "Processing website..", False)
-            output = await process_webpage(file_content)
-
-            file_type = "website"
         else:
-            # some unknown file format
-            # add MIME type-based Processing later
-            output = (
-                "unsupported file format! you have to use another tool to process this."
-            )
-            await emit_message(__event_emitter__, "unsupported file format!")
+            # get the content of whatever file is at the url
+            file_content = await _request(url)
+            file_size = len(file_content)
+            checksum = hashlib.sha256(file_content).hexdigest()
+
+            if processor:
+                await emit_status(
+                    __event_emitter__, f"Processing {file_type} file..", False
+                )
+                output = await processor(file_content)
+                await emit_status(
+                    __event_emitter__, f"Processed {file_type} file", True
+                )
+            elif len(file_name_split) <= 1:
+                # for now, we assume it's a website.
+                # TODO: add mime type checking
+                await emit_status(__event_emitter__, "Processing website..", False)
+                output = await process_webpage(file_content)
+
+                file_type = "website"
+            else:
+                # some unknown file format
+                # add MIME type-based Processing later
+                output = "unsupported file format! you have to use another tool to process this."
+                await emit_message(__event_emitter__, "unsupported file format!")
 
         result = {
             "url": url,
             "filename": file_name_split[0],
             "type": file_type,
-            "size": len(file_content),
-            "checksum": hashlib.sha256(file_content).hexdigest(),
+            "size": file_size,
+            "checksum": checksum,
             "data": output,
         }
 
@@ -701,6 +1441,299 @@ class Tools:
             },
         }
 
+    async def crawl_site(
+        self,
+        url: str,
+        purpose: str,
+        memory: str,
+        __user__: dict,
+        __event_emitter__=None,
+        max_depth: int = 2,
+        max_pages: int = 20,
+        include_pattern: str = "",
+    ) -> str:
+        """
+        crawls a website starting from a url, following links to other pages on the same site, and returns the content of all of them at once.
+        use this instead of calling process_url over and over when user asks about a whole website, such as a documentation site or a project's wiki.
+
+        use the "max_depth" argument for how many links deep to follow from the starting page.
+        use the "max_pages" argument for the maximum amount of pages to fetch.
+        use the "include_pattern" argument to only follow urls matching this regular expression, for example "/docs/". leave empty to follow all links on the site.
+        use the "purpose" argument to describe the purpose of this request.
+        use the "memory" argument for details that must be remembered by the LLM after parsing all the data, such as details about the user.
+        """
+
+        import re
+        import time
+        import hashlib
+        import urllib.parse
+        import urllib.robotparser
+
+        BeautifulSoup = (await import_module("bs4")).BeautifulSoup
+
+        # we define functions inside this method so that the AI can't call them
+
+        def site_of(page_url):
+            host = (urllib.parse.urlparse(page_url).hostname or "").lower()
+            return host[4:] if host.startswith("www.") else host
+
+        def looks_like_webpage(page_url):
+            file_name = urllib.parse.urlparse(page_url).path.split("/")[-1]
+            file_name_split = file_name.split(".")
+            return len(file_name_split) <= 1 or file_name_split[-1].lower() in (
+                "htm",
+                "html",
+                "xhtml",
+                "php",
+                "asp",
+            )
+
+        async def get_robots(page_url):
+            host = urllib.parse.urlparse(page_url).netloc
+            if host not in robots:
+                parser = urllib.robotparser.RobotFileParser()
+                try:
+                    content = await fetch(
+                        f"{urllib.parse.urlparse(page_url).scheme}://{host}/robots.txt",
+                        fetch_valves,
+                        self.circuit_breaker,
+                        self.ttfb_samples,
+                    )
+                    parser.parse(content.decode(errors="replace").splitlines())
+                except RequestError as e:
+                    if e.status and 400 <= e.status < 500 and e.status != 429:
+                        # no robots.txt means everything is allowed
+                        parser.parse([])
+                    else:
+                        # but if it's unreachable, we can't know what's allowed (RFC 9309)
+                        parser.parse(["User-agent: *", "Disallow: /"])
+                robots[host] = parser
+            return robots[host]
+
+        async def wait_politely(page_url):
+            # space out requests to the same host
+            host = urllib.parse.urlparse(page_url).netloc
+            delay = self.valves.crawl_delay
+            if self.valves.crawl_respect_robots:
+                crawl_delay = (await get_robots(page_url)).crawl_delay(
+                    self.valves.user_agent
+                )
+                if crawl_delay:
+                    delay = max(delay, float(crawl_delay))
+
+            lock = host_locks.setdefault(host, asyncio.Lock())
+            async with lock:
+                wait = host_last_request.get(host, 0) + delay - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                host_last_request[host] = time.monotonic()
+
+        def enqueue(page_url, depth):
+            nonlocal scheduled
+
+            page_url = canonicalize_url(page_url)
+            if page_url in seen or scheduled >= page_limit:
+                return
+            seen.add(page_url)
+            scheduled += 1
+            queue.put_nowait((page_url, depth))
+
+        async def crawl_one(page_url, depth):
+            nonlocal site
+
+            async def read_page(response):
+                # the url after following redirects is needed to resolve relative links.
+                # returns no html if the page shouldn't be crawled, before downloading it
+                nonlocal site
+
+                final_url = str(response.url)
+
+                if site_of(final_url) != site:
+                    if depth > 0:
+                        # redirected off the site
+                        return final_url, None
+                    # the starting page decides what the site is
+                    site = site_of(final_url)
+
+                if response.content_type not in ("text/html", "application/xhtml+xml"):
+                    # a pdf, zip or whatever behind a link without a file extension
+                    return final_url, None
+
+                if (
+                    final_url != page_url
+                    and self.valves.crawl_respect_robots
+                    and not (await get_robots(final_url)).can_fetch(
+                        self.valves.user_agent, final_url
+                    )
+                ):
+                    skipped.append(final_url)
+                    return final_url, None
+
+                return final_url, await response.read()
+
+            if self.valves.crawl_respect_robots and not (
+                await get_robots(page_url)
+            ).can_fetch(self.valves.user_agent, page_url):
+                skipped.append(page_url)
+                return
+
+            await wait_politely(page_url)
+            final_url, html = await fetch(
+                page_url,
+                fetch_valves,
+                self.circuit_breaker,
+                self.ttfb_samples,
+                read_page,
+            )
+            if html is None:
+                return
+
+            canonical_url = canonicalize_url(final_url)
+            if canonical_url != page_url:
+                if canonical_url in seen:
+                    # redirected to a page we already have
+                    return
+                seen.add(canonical_url)
+                page_url = canonical_url
+
+            checksum = hashlib.sha256(html).hexdigest()
+            if checksum in checksums:
+                # same page under another url
+                return
+            checksums.add(checksum)
+
+            soup = await asyncio.to_thread(BeautifulSoup, html, "html.parser")
+
+            if depth < max_depth:
+                base_url = final_url
+                base = soup.find("base", href=True)
+                if base:
+                    try:
+                        base_url = urllib.parse.urljoin(final_url, base["href"])
+                    except ValueError:
+                        pass
+
+                for a in soup.find_all("a", href=True):
+                    try:
+                        link = urllib.parse.urljoin(base_url, a["href"])
+                        if urllib.parse.urlparse(link).scheme not in ("http", "https"):
+                            continue
+                        if site_of(link) != site:
+                            continue
+                        if pattern and not pattern.search(link):
+                            continue
+                        if not looks_like_webpage(link):
+                            continue
+                        enqueue(link, depth + 1)
+                    except ValueError:
+                        # malformed link, like a bad port or an unclosed ipv6 bracket
+                        continue
+
+            data = await scrape_webpage(html, soup=soup)
+            data.pop("urls", None)
+            data.pop("message", None)
+            pages.append({"url": page_url, "depth": depth, "data": data})
+
+            await emit_status(__event_emitter__, f"Crawled {len(pages)} pages..", False)
+
+        async def worker():
+            while True:
+                page_url, depth = await queue.get()
+                try:
+                    await crawl_one(page_url, depth)
+                except Exception as e:
+                    errors.append(f"ERROR Processing URL {page_url}: {e}")
+                finally:
+                    queue.task_done()
+
+        ####################
+        # start crawling
+        #####
+        # hedged requests would send duplicate requests behind the politeness delay's back
+        fetch_valves = self.valves.model_copy(update={"hedge_requests": False})
+        page_limit = max(1, min(max_pages, self.valves.crawl_max_pages))
+        try:
+            pattern = re.compile(include_pattern) if include_pattern else None
+        except re.error as e:
+            return {
+                "url": url,
+                "type": "crawl",
+                "error": f"ERROR invalid include_pattern {include_pattern!r}: {e}. use a valid regular expression, or leave it empty.",
+            }
+        try:
+            canonicalize_url(url)
+            site = site_of(url)
+        except ValueError as e:
+            return {
+                "url": url,
+                "type": "crawl",
+                "error": f"ERROR invalid url {url!r}: {e}",
+            }
+
+        queue = asyncio.Queue()
+        seen = set()
+        checksums = set()
+        robots = {}
+        host_locks = {}
+        host_last_request = {}
+        scheduled = 0
+
+        pages = []
+        skipped = []
+        errors = []
+
+        await emit_status(__event_emitter__, f"Crawling {site}..", False)
+
+        # the starting page is always crawled, even if it doesn't match the pattern
+        enqueue(url, 0)
+
+        workers = [
+            asyncio.create_task(worker())
+            for _ in range(max(1, self.valves.crawl_concurrency))
+        ]
+        try:
+            await queue.join()
+        finally:
+            for task in workers:
+                task.cancel()
+
+        # a lot of text (navigation, footers..) is the same on every page of a site.
+        # only keep it on the first page it appeared on
+        pages.sort(key=lambda page: (page["depth"], page["url"]))
+        seen_text = set()
+        for page in pages:
+            for category in ("headers", "paragraphs", "images"):
+                if category not in page["data"]:
+                    continue
+                unique = []
+                for text in page["data"][category]:
+                    if text and text not in seen_text:
+                        seen_text.add(text)
+                        unique.append(text)
+                if unique:
+                    page["data"][category] = unique
+                else:
+                    del page["data"][category]
+
+        await emit_status(__event_emitter__, f"Crawled {len(pages)} pages", True)
+
+        result = {
+            "url": url,
+            "type": "crawl",
+            "pages": pages,
+        }
+        if skipped:
+            result["skipped_by_robots_txt"] = skipped
+        if errors:
+            result["errors"] = errors
+
+        result["ai_instructions"] = {
+            "important_details": memory,
+            "purpose_of_request": f"{purpose}. Include links to all sources.",
+        }
+
+        return result
+
     async def search_web(
         self,
         query: str,